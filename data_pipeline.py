@@ -13,9 +13,12 @@
 # copies or substantial portions of the Software.
 
 
+import hashlib
 import json
+import math
 import re
 import os
+import sys
 import time
 import threading
 import requests
@@ -23,6 +26,24 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+# 可选的C加速HTML解析库，未安装时回退到 html.parser
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# 主题聚类所需的依赖，未安装时跳过该步骤
+try:
+    import jieba
+    import numpy as np
+    import scipy.sparse as sp
+except ImportError:
+    np = None
+
 
 # --- 输入/输出文件 ---
 INPUT_HTML_FILE = '我的活动记录.html'
@@ -33,9 +54,27 @@ SETTINGS_FILE = 'settings.json'
 STRUCTURED_JSON_PATH = 'structured_gemini_history.json'
 INDEXED_JSONL_PATH = 'indexed_and_tagged_history.jsonl'
 
+# HTML解析后端: "auto" / "selectolax" / "lxml" / "html.parser"
+# "auto" 会按 selectolax -> lxml -> html.parser 的顺序选择第一个可用的后端
+HTML_PARSER_BACKEND = "auto"
+HTML_PARSER_BACKENDS = ('auto', 'selectolax', 'lxml', 'html.parser')
+
 ENABLE_AI_ANALYSIS = True  # 设置为 True 以启用API调用，False 则跳过
+# Gemini 活动记录会自动删除，导出往往不完整。为 True 时保留缓存中已分析、但本次导出里没有的对话；
+# 从旧版 html.parser 切换到新后端后，如需丢弃旧解析产生的错误记录，可设为 False
+KEEP_MISSING_CACHED_CONVERSATIONS = True
 AI_PROVIDER = "gemini"  
 API_KEYS_FILE = 'valid_keys.txt'
+# 主题聚类 (TF-IDF + Mini-Batch K-Means)
+ENABLE_TOPIC_CLUSTERING = True
+TOPIC_COUNT = 20
+TOPIC_MAX_FEATURES = 20000
+TOPIC_TAG_WEIGHT = 3  # 标签在向量中重复的次数，使AI标签比正文词更有分量
+TOPIC_BATCH_SIZE = 256
+TOPIC_MAX_ITER = 100
+TOPIC_RANDOM_SEED = 42
+STOPWORDS_FILES = ['聊天记录分析/stopwords_cn.txt', '聊天记录分析/stopwords_scu.txt', '聊天记录分析/stopwords_hit.txt']
+
 MAX_CONCURRENT_REQUESTS = 10
 MAX_RETRY_ATTEMPTS = 5
 RETRY_DELAY_SECONDS = 2
@@ -45,6 +84,18 @@ GOOGLE_API_BASE_URL = "https://generativelanguage.googleapis.com"
 
 OPENAI_BASE_URL = None
 OPENAI_API_MODEL = None
+OPENAI_SYSTEM_PROMPT = "You are an expert in information retrieval and data processing."
+
+# --- 试运行 (dry-run) 估算 ---
+# 设置为 True 或使用 `python data_pipeline.py --dry-run`，只解析记录并估算用量，不调用任何API
+DRY_RUN = False
+# 每个API密钥的速率限制，可在 settings.json 的 "rate_limits": {"rpm": ..., "tpm": ...} 中覆盖
+KEY_RPM_LIMIT = 15
+KEY_TPM_LIMIT = 1_000_000
+ESTIMATED_COMPLETION_TOKENS = 80  # 标题 + 3~7个标签的JSON，约80个token
+ESTIMATED_REQUEST_LATENCY_SECONDS = 5
+MAX_BATCH_PROMPT_TOKENS = 32000  # 建议批量大小时单个请求的prompt上限
+MAX_BATCH_COMPLETION_TOKENS = 8192  # 模型单次输出的token上限
 
 
 key_lock = threading.Lock()
@@ -55,7 +106,8 @@ current_key_index = 0
 
 def load_settings():
     """从 settings.json 加载配置。"""
-    global AI_PROVIDER, OPENAI_BASE_URL, OPENAI_API_MODEL, GEMINI_API_MODEL
+    global AI_PROVIDER, OPENAI_BASE_URL, OPENAI_API_MODEL, GEMINI_API_MODEL, HTML_PARSER_BACKEND
+    global KEY_RPM_LIMIT, KEY_TPM_LIMIT
     
     if not os.path.exists(SETTINGS_FILE):
         print(f"[警告] 配置文件 '{SETTINGS_FILE}' 未找到。将使用默认设置 (Gemini)。")
@@ -80,6 +132,28 @@ def load_settings():
             openai_config = settings['openai']
             OPENAI_BASE_URL = openai_config.get('base_url')
             OPENAI_API_MODEL = openai_config.get('model')
+
+        # 读取每个密钥的速率限制 (用于 dry-run 估算)
+        if 'rate_limits' in settings:
+            rate_limits = settings['rate_limits']
+            for name, default in (('rpm', KEY_RPM_LIMIT), ('tpm', KEY_TPM_LIMIT)):
+                value = rate_limits.get(name, default)
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                    print(f"[警告] rate_limits.{name} 必须为正数，当前值 {value!r} 无效，将使用默认值 {default}。")
+                    value = default
+                if name == 'rpm':
+                    KEY_RPM_LIMIT = value
+                else:
+                    KEY_TPM_LIMIT = value
+
+        # 读取HTML解析后端
+        if 'html_parser_backend' in settings:
+            backend = settings['html_parser_backend']
+            if isinstance(backend, str) and backend.lower() in HTML_PARSER_BACKENDS:
+                HTML_PARSER_BACKEND = backend.lower()
+            else:
+                print(f"[警告] html_parser_backend 必须是 {', '.join(HTML_PARSER_BACKENDS)} 之一，"
+                      f"当前值 {backend!r} 无效，将使用默认值 {HTML_PARSER_BACKEND}。")
             
         print(f"成功从 '{SETTINGS_FILE}' 加载配置。AI提供商设置为: {AI_PROVIDER.upper()}")
         if AI_PROVIDER == 'gemini':
@@ -90,6 +164,24 @@ def load_settings():
     except Exception as e:
         print(f"加载配置文件时出错: {e}")
 
+def resolve_html_backend(backend=None):
+    """根据配置和已安装的库确定实际使用的HTML解析后端。"""
+    backend = (backend or HTML_PARSER_BACKEND).lower()
+    available = {
+        'selectolax': LexborHTMLParser is not None,
+        'lxml': lxml is not None,
+        'html.parser': True,
+    }
+    if backend == 'auto':
+        return next(name for name, ok in available.items() if ok)
+    if backend not in available:
+        print(f"[警告] 未知的HTML解析后端 '{backend}'，将使用 html.parser。")
+        return 'html.parser'
+    if not available[backend]:
+        print(f"[警告] HTML解析后端 '{backend}' 未安装，将使用 html.parser。")
+        return 'html.parser'
+    return backend
+
 def clean_html_content(html_text: str) -> str:
     """
     使用BeautifulSoup清理HTML内容，移除标签并规范化空白。
@@ -101,23 +193,138 @@ def clean_html_content(html_text: str) -> str:
     lines = [line.strip() for line in text.splitlines()]
     return '\n'.join(line for line in lines if line)
 
-def parse_and_clean_html(html_filepath):
+# 活动卡片中的时间戳独占一个文本节点，因此可以接受任意时区缩写
+TIMESTAMP_REGEX = r'\d{4}年\d{1,2}月\d{1,2}日 \d{1,2}:\d{2}:\d{2}(?: [A-Za-z][A-Za-z0-9+:-]*)?'
+PROMPT_PREFIX = 'Prompted'
+
+# 只在这些块级元素的边界换行，行内元素 (strong/code/a 等) 的文本直接拼接
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figure',
+    'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'ol', 'p', 'pre',
+    'section', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul'
+}
+
+def _join_lines(text):
+    """按行拆分文本，去除每行首尾空白和空行。"""
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def _extract_card_fields(nodes):
     """
-    从Google活动记录的HTML文件中解析对话，并直接清理内容。
+    从活动卡片内容区的直接子节点中提取 (用户提问, 时间戳, AI回答)。
+
+    nodes 为 (tag, text) 序列，文本节点的 tag 为 '-text'，块级元素的 text 前后带换行。
+    卡片结构固定为 "Prompted 提问 <br> 时间戳 <br> 回答"，因此时间戳只在直接文本节点中查找，
+    消息正文中出现的 "Prompted" 或日期不会影响切分。
+    不是提问记录的卡片返回 None，缺少时间戳时时间戳为 None。
     """
-    print(f"--- 步骤 1: 解析和清理HTML文件: {html_filepath} ---")
-    if not os.path.exists(html_filepath):
-        print(f"[错误] 输入文件 '{html_filepath}' 未找到。")
+    prompt_parts, response_parts = [], []
+    timestamp = None
+    for tag, text in nodes:
+        if timestamp is None:
+            if tag == '-text' and re.fullmatch(TIMESTAMP_REGEX, text.strip()):
+                timestamp = text.strip()
+            else:
+                prompt_parts.append(text)
+        else:
+            response_parts.append(text)
+
+    prompt = ''.join(prompt_parts).replace('\xa0', ' ').strip()
+    if not prompt.startswith(PROMPT_PREFIX):
         return None
+    prompt = _join_lines(prompt[len(PROMPT_PREFIX):])
+    return prompt, timestamp, _join_lines(''.join(response_parts))
+
+def _block_text_selectolax(node):
+    """提取 selectolax 元素的文本，仅在块级元素边界插入换行。"""
+    parts = []
+    for child in node.iter(include_text=True):
+        if child.tag == '-text':
+            parts.append(child.text(deep=False))
+        elif child.tag not in ('-comment', 'script', 'style'):
+            parts.append(_block_text_selectolax(child))
+    text = ''.join(parts)
+    return f"\n{text}\n" if node.tag in BLOCK_TAGS else text
+
+def _iter_card_nodes_selectolax(html_bytes):
+    """使用 selectolax (lexbor) 遍历活动卡片，逐个产出内容区子节点序列。"""
+    tree = LexborHTMLParser(html_bytes)
+    for card in tree.css('div.outer-cell'):
+        content = card.css_first('div.content-cell')
+        if content is None:
+            continue
+        yield [
+            (node.tag, node.text(deep=False) if node.tag == '-text' else _block_text_selectolax(node))
+            for node in content.iter(include_text=True)
+            if node.tag != '-comment'
+        ]
+
+def _block_text_lxml(element):
+    """提取 lxml 元素的文本 (不含 tail)，仅在块级元素边界插入换行。"""
+    parts = [element.text or '']
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in ('script', 'style'):
+            parts.append(_block_text_lxml(child))
+        parts.append(child.tail or '')
+    text = ''.join(parts)
+    return f"\n{text}\n" if element.tag in BLOCK_TAGS else text
+
+def _iter_card_nodes_lxml(html_bytes):
+    """使用 lxml 遍历活动卡片，逐个产出内容区子节点序列。"""
+    # Takeout 导出的文件为 UTF-8，未声明 charset 时 lxml 会按 latin-1 解码
+    root = lxml.html.fromstring(html_bytes, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    for card in root.find_class('outer-cell'):
+        contents = card.find_class('content-cell')
+        if not contents:
+            continue
+        content = contents[0]
+        nodes = []
+        if content.text:
+            nodes.append(('-text', content.text))
+        for child in content:
+            # 注释节点的 tag 不是字符串，跳过其内容但保留 tail 文本
+            if isinstance(child.tag, str):
+                nodes.append((child.tag, _block_text_lxml(child)))
+            if child.tail:
+                nodes.append(('-text', child.tail))
+        yield nodes
+
+def _parse_conversations_structured(html_filepath, backend):
+    """按活动卡片的DOM结构解析对话。"""
+    with open(html_filepath, 'rb') as f:
+        html_bytes = f.read()
+    iter_card_nodes = _iter_card_nodes_selectolax if backend == 'selectolax' else _iter_card_nodes_lxml
+
+    parsed_conversations = []
+    i = 0
+    for nodes in iter_card_nodes(html_bytes):
+        fields = _extract_card_fields(nodes)
+        if fields is None:
+            continue
+        i += 1
+        user_prompt, timestamp, ai_response = fields
+        if timestamp is None:
+            print(f"[警告] 在第 {i} 个对话块中未找到时间戳，已跳过。")
+            continue
+        parsed_conversations.append({
+            "id": i,
+            "timestamp": timestamp,
+            "user_prompt": user_prompt.replace('”', '"').replace('“', '"'),
+            "ai_response": ai_response
+        })
+    return parsed_conversations
 
+def _parse_conversations_text(html_filepath):
+    """将整个页面展平为文本，按 'Prompted' 和时间戳切分对话 (html.parser 后端)。"""
     with open(html_filepath, 'r', encoding='utf-8') as f:
         soup = BeautifulSoup(f, 'html.parser')
     
     full_text = soup.get_text()
 
-    dialogue_chunks = full_text.split('Prompted')
+    dialogue_chunks = full_text.split(PROMPT_PREFIX)
     parsed_conversations = []
     
+    # 展平后的文本没有分隔符，时区必须写死，否则会吞掉紧随其后的回答正文
     timestamp_regex = r'\d{4}年\d{1,2}月\d{1,2}日 \d{2}:\d{2}:\d{2} JST'
 
     for i, chunk in enumerate(dialogue_chunks[1:], 1):
@@ -142,6 +349,23 @@ def parse_and_clean_html(html_filepath):
             parsed_conversations.append(conversation)
         else:
             print(f"[警告] 在第 {i} 个对话块中未找到时间戳，已跳过。")
+    return parsed_conversations
+
+def parse_and_clean_html(html_filepath, backend=None):
+    """
+    从Google活动记录的HTML文件中解析对话，并直接清理内容。
+    """
+    print(f"--- 步骤 1: 解析和清理HTML文件: {html_filepath} ---")
+    if not os.path.exists(html_filepath):
+        print(f"[错误] 输入文件 '{html_filepath}' 未找到。")
+        return None
+
+    backend = resolve_html_backend(backend)
+    print(f"使用HTML解析后端: {backend}")
+    if backend == 'html.parser':
+        parsed_conversations = _parse_conversations_text(html_filepath)
+    else:
+        parsed_conversations = _parse_conversations_structured(html_filepath, backend)
             
     print(f"成功解析并清理了 {len(parsed_conversations)} 轮对话。")
     with open(STRUCTURED_JSON_PATH, 'w', encoding='utf-8') as f:
@@ -170,21 +394,55 @@ def load_api_keys(provider):
         print(f"加载API密钥时出错: {e}")
         return False
 
-def load_processed_ids(path):
-    """加载已处理的ID以支持断点续传。"""
-    processed_ids = set()
+def conversation_key(conversation):
+    """
+    断点续传缓存使用的稳定键：时间戳 + 用户提问 (忽略空白) 的哈希。
+    不依赖解析顺序产生的ID，因此更换HTML解析后端后缓存仍对应到同一轮对话。
+    """
+    prompt = re.sub(r'\s+', '', conversation.get('user_prompt') or '')
+    raw = f"{conversation.get('timestamp', '')}\n{prompt}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def load_analysis_cache(path):
+    """加载已分析的记录 {conversation_key: 记录} 以支持断点续传。"""
+    cache = {}
     if not os.path.exists(path):
-        return processed_ids
+        return cache
     with open(path, 'r', encoding='utf-8') as f:
         for line in f:
             try:
                 data = json.loads(line)
-                item_id = data.get('id')
-                if item_id is not None:
-                    processed_ids.add(item_id)
+                cache[conversation_key(data)] = data
             except json.JSONDecodeError:
                 continue
-    return processed_ids
+    return cache
+
+def merge_cached_analysis(conversations, cache):
+    """
+    将缓存中的分析结果 (标题、标签等) 合并到本次解析出的对话上，ID以本次解析为准。
+    KEEP_MISSING_CACHED_CONVERSATIONS 为 True 时，本次导出中已不存在的缓存记录
+    追加在末尾并分配新的ID。
+    """
+    conversation_fields = {'id', 'timestamp', 'user_prompt', 'ai_response'}
+    results = []
+    current_keys = set()
+    for conv in conversations:
+        key = conversation_key(conv)
+        current_keys.add(key)
+        record = cache.get(key)
+        if record is not None:
+            analysis = {k: v for k, v in record.items() if k not in conversation_fields}
+            results.append({**conv, **analysis})
+
+    if KEEP_MISSING_CACHED_CONVERSATIONS:
+        next_id = max((conv.get('id') or 0 for conv in conversations), default=0) + 1
+        missing = [record for key, record in cache.items() if key not in current_keys]
+        for record in missing:
+            results.append({**record, 'id': next_id})
+            next_id += 1
+        if missing:
+            print(f"保留了 {len(missing)} 条本次导出中已不存在的历史分析记录。")
+    return results
 
 def get_analysis_prompt(conversation_data):
     """生成用于AI分析的通用prompt。"""
@@ -268,7 +526,7 @@ def fetch_openai_analysis(conversation_data, prompt):
         request_body = {
             "model": OPENAI_API_MODEL,
             "messages": [
-                {"role": "system", "content": "You are an expert in information retrieval and data processing."},
+                {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             "temperature": 0.2,
@@ -311,6 +569,91 @@ def fetch_ai_analysis(conversation_data):
     return (conversation_data, analysis_result)
 
 
+def estimate_tokens(text):
+    """粗略估算token数：中日韩字符约1个token/字，其余字符约4个字符/token。"""
+    if not text:
+        return 0
+    cjk_chars = len(re.findall(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]', text))
+    return cjk_chars + math.ceil((len(text) - cjk_chars) / 4)
+
+def count_api_keys():
+    """统计密钥文件中的密钥数量 (不做任何校验请求)。"""
+    if not os.path.exists(API_KEYS_FILE):
+        return 0
+    with open(API_KEYS_FILE, 'r') as f:
+        return sum(1 for key in f if key.strip())
+
+def plan_pipeline_run(conversations):
+    """
+    试运行：统计待分析的对话，估算token用量、请求数、吞吐上限和预计耗时，
+    并给出并发数和批量大小建议。不调用任何API。
+    """
+    print("\n--- 试运行: 估算AI分析用量 ---")
+    analysis_cache = load_analysis_cache(INDEXED_JSONL_PATH)
+    pending = [conv for conv in conversations if conversation_key(conv) not in analysis_cache]
+    print(f"共 {len(conversations)} 轮对话，已分析 {len(conversations) - len(pending)} 轮，待分析 {len(pending)} 轮。")
+    if not pending:
+        print("没有需要分析的新对话。")
+        return None
+
+    prompt_tokens = [estimate_tokens(get_analysis_prompt(conv)) for conv in pending]
+    if AI_PROVIDER == "openai":
+        system_tokens = estimate_tokens(OPENAI_SYSTEM_PROMPT)
+        prompt_tokens = [tokens + system_tokens for tokens in prompt_tokens]
+    total_prompt_tokens = sum(prompt_tokens)
+    total_completion_tokens = ESTIMATED_COMPLETION_TOKENS * len(pending)
+    avg_tokens_per_request = (total_prompt_tokens + total_completion_tokens) / len(pending)
+
+    num_keys = count_api_keys()
+    if num_keys == 0:
+        print(f"[警告] 未在 '{API_KEYS_FILE}' 中找到密钥，按1个密钥估算。")
+        num_keys = 1
+
+    # 吞吐上限 (请求/分钟)：取所有密钥的RPM总和与TPM总和折算值中的较小者
+    rpm_ceiling = num_keys * KEY_RPM_LIMIT
+    tpm_ceiling = num_keys * KEY_TPM_LIMIT / avg_tokens_per_request
+    ceiling = min(rpm_ceiling, tpm_ceiling)
+    bottleneck = "RPM" if rpm_ceiling <= tpm_ceiling else "TPM"
+    # 当前并发设置下的吞吐 (Little 定律：并发数 / 单次请求延迟)
+    concurrency_rate = MAX_CONCURRENT_REQUESTS / ESTIMATED_REQUEST_LATENCY_SECONDS * 60
+    effective_rate = min(ceiling, concurrency_rate)
+    eta_minutes = len(pending) / effective_rate
+
+    recommended_concurrency = max(1, math.ceil(ceiling / 60 * ESTIMATED_REQUEST_LATENCY_SECONDS))
+    # 受RPM限制时，把多轮对话合并到一个请求中可以提高吞吐，直到触及TPM或单次输入/输出上限
+    avg_prompt_tokens = total_prompt_tokens / len(pending)
+    tpm_batch = KEY_TPM_LIMIT / KEY_RPM_LIMIT / avg_tokens_per_request
+    prompt_batch = MAX_BATCH_PROMPT_TOKENS / max(avg_prompt_tokens, 1)
+    completion_batch = MAX_BATCH_COMPLETION_TOKENS / ESTIMATED_COMPLETION_TOKENS
+    recommended_batch_size = max(1, int(min(tpm_batch, prompt_batch, completion_batch)))
+
+    plan = {
+        "pending_conversations": len(pending),
+        "requests": len(pending),
+        "prompt_tokens": total_prompt_tokens,
+        "completion_tokens": total_completion_tokens,
+        "api_keys": num_keys,
+        "throughput_ceiling_rpm": round(ceiling, 1),
+        "bottleneck": bottleneck,
+        "effective_rpm": round(effective_rate, 1),
+        "eta_minutes": round(eta_minutes, 1),
+        "recommended_concurrency": recommended_concurrency,
+        "recommended_batch_size": recommended_batch_size,
+    }
+
+    print(f"AI提供商: {AI_PROVIDER.upper()}，密钥数: {num_keys}，每个密钥限制: {KEY_RPM_LIMIT} RPM / {KEY_TPM_LIMIT} TPM")
+    print(f"预计请求数: {len(pending)} (不含重试)")
+    print(f"预计prompt tokens: {total_prompt_tokens:,} (平均 {avg_prompt_tokens:.0f}/请求，最大 {max(prompt_tokens):,})")
+    print(f"预计completion tokens: {total_completion_tokens:,}")
+    print(f"吞吐上限: {ceiling:.1f} 请求/分钟 (瓶颈: {bottleneck})")
+    print(f"当前并发 {MAX_CONCURRENT_REQUESTS} 下的吞吐: {effective_rate:.1f} 请求/分钟，预计耗时: {eta_minutes:.1f} 分钟")
+    print(f"建议并发数 (MAX_CONCURRENT_REQUESTS): {recommended_concurrency}")
+    if recommended_batch_size > 1:
+        print(f"建议批量大小: 每个请求 {recommended_batch_size} 轮对话 (当前流水线每个请求分析1轮，受{bottleneck}限制时合并请求可提高吞吐)")
+    else:
+        print("建议批量大小: 1 (保持每个请求分析1轮对话)")
+    return plan
+
 def run_ai_analysis_pipeline(conversations):
     """执行AI分析流程。"""
     print("\n--- 步骤 2: 执行AI索引和标签生成 ---")
@@ -323,16 +666,12 @@ def run_ai_analysis_pipeline(conversations):
         print("[错误] OpenAI API的 base_url 或 model 未在settings.json中配置，无法继续。")
         return conversations
 
-    processed_ids = load_processed_ids(INDEXED_JSONL_PATH)
-    tasks_to_process = [conv for conv in conversations if conv.get('id') not in processed_ids]
+    analysis_cache = load_analysis_cache(INDEXED_JSONL_PATH)
+    tasks_to_process = [conv for conv in conversations if conversation_key(conv) not in analysis_cache]
 
     if not tasks_to_process:
         print("所有对话都已分析过，将从缓存加载。")
-        all_results = []
-        with open(INDEXED_JSONL_PATH, 'r', encoding='utf-8') as f:
-            for line in f:
-                all_results.append(json.loads(line))
-        return all_results
+        return merge_cached_analysis(conversations, analysis_cache)
 
     print(f"需要分析 {len(tasks_to_process)} 个新对话，使用 {AI_PROVIDER.upper()} API。")
     
@@ -348,18 +687,172 @@ def run_ai_analysis_pipeline(conversations):
                 with write_lock:
                     f_out.write(json.dumps(combined_result, ensure_ascii=False) + '\n')
                     f_out.flush()
+                analysis_cache[conversation_key(original_data)] = combined_result
     
     print("AI分析完成。")
-    all_analyzed_data = []
-    with open(INDEXED_JSONL_PATH, 'r', encoding='utf-8') as f:
-        for line in f:
-            all_analyzed_data.append(json.loads(line))
-    return all_analyzed_data
+    return merge_cached_analysis(conversations, analysis_cache)
+
 
+def get_topics_json_path(output_json_path):
+    """主题聚类结果保存在最终JSON旁的 "<文件名>_topics.json"，Web 应用按同样的规则查找。"""
+    return os.path.splitext(output_json_path)[0] + '_topics.json'
+
+def load_stopwords():
+    """加载 Web 应用目录下的停用词表。"""
+    stopwords = set()
+    for filename in STOPWORDS_FILES:
+        if not os.path.exists(filename):
+            continue
+        with open(filename, 'r', encoding='utf-8') as f:
+            stopwords.update(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return stopwords
+
+def tokenize_for_topics(item, stopwords):
+    """将一轮对话切分为用于聚类的词序列，AI标签按 TOPIC_TAG_WEIGHT 加权。"""
+    text = f"{item.get('user_prompt') or ''}\n{item.get('ai_response') or ''}"
+    text = re.sub(r'http[s]?://\S+', '', text)
+    tokens = [
+        word.lower() for word in jieba.lcut(text)
+        if len(word) >= 2 and re.search(r'[\u4e00-\u9fa5a-zA-Z]', word) and word.lower() not in stopwords
+    ]
+    for tag in item.get('tags') or []:
+        tag = str(tag).strip().lower()
+        if tag:
+            tokens.extend([tag] * TOPIC_TAG_WEIGHT)
+    return tokens
+
+def build_tfidf_matrix(documents, max_features=TOPIC_MAX_FEATURES):
+    """
+    构建按行L2归一化的稀疏TF-IDF矩阵 (CSR)。
+    只保留出现在至少2篇且不超过一半文档中的词，按文档频率取前 max_features 个。
+    """
+    n_docs = len(documents)
+    doc_freq = {}
+    for tokens in documents:
+        for token in set(tokens):
+            doc_freq[token] = doc_freq.get(token, 0) + 1
+
+    max_df = max(2, n_docs // 2)
+    candidates = [(token, df) for token, df in doc_freq.items() if 2 <= df <= max_df]
+    candidates.sort(key=lambda x: (-x[1], x[0]))
+    vocabulary = [token for token, _ in candidates[:max_features]]
+    index = {token: i for i, token in enumerate(vocabulary)}
+
+    rows, cols, values = [], [], []
+    for row, tokens in enumerate(documents):
+        counts = {}
+        for token in tokens:
+            col = index.get(token)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        rows.extend([row] * len(counts))
+        cols.extend(counts.keys())
+        values.extend(counts.values())
+
+    matrix = sp.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, cols)),
+        shape=(n_docs, len(vocabulary))
+    )
+    df = np.array([doc_freq[token] for token in vocabulary], dtype=np.float32)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1
+    matrix.data = np.log1p(matrix.data)
+    matrix = matrix @ sp.diags(idf)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sp.diags(1 / norms) @ matrix
+    return sp.csr_matrix(matrix, dtype=np.float32), vocabulary
+
+def _kmeans_plus_plus(matrix, n_clusters, rng, sample_size=5000):
+    """在最多 sample_size 行的样本上用 k-means++ 选择初始簇中心 (余弦距离)。"""
+    sample = matrix[rng.choice(matrix.shape[0], min(sample_size, matrix.shape[0]), replace=False)]
+    centers = [sample[rng.integers(sample.shape[0])].toarray().ravel()]
+    distances = 1 - sample @ centers[0]
+    for _ in range(1, n_clusters):
+        weights = np.clip(distances, 0, None) ** 2
+        total = weights.sum()
+        index = rng.choice(sample.shape[0], p=weights / total) if total > 0 else rng.integers(sample.shape[0])
+        centers.append(sample[index].toarray().ravel())
+        distances = np.minimum(distances, 1 - sample @ centers[-1])
+    return np.vstack(centers)
+
+def minibatch_kmeans(matrix, n_clusters, batch_size=TOPIC_BATCH_SIZE, max_iter=TOPIC_MAX_ITER, seed=TOPIC_RANDOM_SEED):
+    """
+    在归一化的稀疏矩阵上运行球面 Mini-Batch K-Means (Sculley, 2010)。
+    返回 (每行的簇编号, 簇中心矩阵)。
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = matrix.shape[0]
+    centers = _kmeans_plus_plus(matrix, n_clusters, rng)
+    counts = np.zeros(n_clusters)
+
+    for _ in range(max_iter):
+        batch = matrix[rng.choice(n_rows, min(batch_size, n_rows), replace=False)]
+        labels = np.asarray((batch @ centers.T).argmax(axis=1)).ravel()
+        for cluster in np.unique(labels):
+            members = batch[labels == cluster]
+            counts[cluster] += members.shape[0]
+            rate = members.shape[0] / counts[cluster]
+            centers[cluster] = (1 - rate) * centers[cluster] + rate * np.asarray(members.mean(axis=0)).ravel()
+        norms = np.linalg.norm(centers, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centers /= norms
+
+    labels = np.asarray((matrix @ centers.T).argmax(axis=1)).ravel()
+    return labels, centers
+
+def _skip_topic_clustering(data, path, reason):
+    """跳过主题聚类：清空 topic_id 并删除上一次运行留下的主题文件，避免与新数据不一致。"""
+    print(f"[信息] {reason}，跳过主题聚类。")
+    for item in data:
+        item['topic_id'] = None
+    if os.path.exists(path):
+        os.remove(path)
+        print(f"已删除过期的主题文件 '{path}'。")
+    return None
+
+def run_topic_clustering(data, path):
+    """为每轮对话分配 topic_id，并将主题描述保存到 path。"""
+    print("\n--- 步骤 3: TF-IDF 主题聚类 ---")
+    if np is None:
+        return _skip_topic_clustering(data, path, "未安装 numpy/scipy/jieba")
+
+    stopwords = load_stopwords()
+    documents = [tokenize_for_topics(item, stopwords) for item in tqdm(data, desc="分词中")]
+    matrix, vocabulary = build_tfidf_matrix(documents)
+
+    # 没有任何保留词的对话不参与聚类
+    non_empty = np.flatnonzero(matrix.getnnz(axis=1))
+    n_clusters = min(TOPIC_COUNT, len(non_empty))
+    if n_clusters < 2:
+        return _skip_topic_clustering(data, path, "可用于聚类的对话太少")
+    print(f"TF-IDF矩阵: {matrix.shape[0]} 篇对话 x {matrix.shape[1]} 个词，非零元素 {matrix.nnz} 个")
+
+    labels, centers = minibatch_kmeans(matrix[non_empty], n_clusters)
+    for item in data:
+        item['topic_id'] = None
+    for row, label in zip(non_empty, labels):
+        data[row]['topic_id'] = int(label)
+
+    sizes = np.bincount(labels, minlength=n_clusters)
+    topics = []
+    for cluster in range(n_clusters):
+        top_terms = [vocabulary[i] for i in np.argsort(centers[cluster])[::-1][:8] if centers[cluster, i] > 0]
+        topics.append({
+            "id": cluster,
+            "label": " / ".join(top_terms[:3]) or f"主题 {cluster}",
+            "terms": top_terms,
+            "size": int(sizes[cluster])
+        })
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"topics": topics}, f, ensure_ascii=False, indent=2)
+    print(f"成功！{len(non_empty)} 轮对话被聚为 {n_clusters} 个主题，主题描述已保存到 '{path}'。")
+    return topics
 
 def save_as_final_json(data, path):
     """将最终数据保存为格式化的JSON文件。"""
-    print(f"\n--- 步骤 3: 生成最终JSON文件 ---")
+    print(f"\n--- 步骤 4: 生成最终JSON文件 ---")
     data.sort(key=lambda x: x.get('id', 0))
     
     final_data = []
@@ -369,6 +862,7 @@ def save_as_final_json(data, path):
             "timestamp": item.get('timestamp'),
             "title": item.get('index_title', '无标题'),
             "tags": item.get('tags', []),
+            "topic_id": item.get('topic_id'),
             "user_prompt_cleaned": item.get('user_prompt'),
             "ai_response_cleaned": item.get('ai_response')
         })
@@ -379,7 +873,7 @@ def save_as_final_json(data, path):
 
 def save_as_txt(data, path):
     """将最终数据保存为人类可读的TXT文件。"""
-    print(f"\n--- 步骤 4: 生成TXT报告文件 ---")
+    print(f"\n--- 步骤 5: 生成TXT报告文件 ---")
     data.sort(key=lambda x: x.get('id', 0))
 
     with open(path, 'w', encoding='utf-8') as f:
@@ -407,6 +901,11 @@ def main():
         print("因无法解析HTML，流水线终止。")
         return
 
+    if DRY_RUN or '--dry-run' in sys.argv:
+        plan_pipeline_run(conversations)
+        print("\n====== 试运行完成，未调用任何API ======")
+        return
+
     if ENABLE_AI_ANALYSIS:
         processed_data = run_ai_analysis_pipeline(conversations)
     else:
@@ -417,6 +916,11 @@ def main():
         print("没有可处理的数据，流水线终止。")
         return
         
+    if ENABLE_TOPIC_CLUSTERING:
+        run_topic_clustering(processed_data, get_topics_json_path(OUTPUT_JSON_PATH))
+    else:
+        _skip_topic_clustering(processed_data, get_topics_json_path(OUTPUT_JSON_PATH), "ENABLE_TOPIC_CLUSTERING 为 False")
+
     save_as_final_json(processed_data, OUTPUT_JSON_PATH)
     save_as_txt(processed_data, OUTPUT_TXT_PATH)
     
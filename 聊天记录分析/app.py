@@ -1,25 +1,281 @@
 import json
+import os
 import re
+import threading
 import jieba
-from flask import Flask, jsonify, request, send_from_directory
+import jieba.posseg as pseg
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from heavy_hitters import SpaceSaving
 
 app = Flask(__name__, static_folder='.')
 
 # 共享数据和辅助函数
-data_cache = None
+# 数据集配置文件，格式: {"datasets": {"名称": "JSON路径", ...}, "memory_budget_mb": 512}
+# 文件不存在时只提供一个指向 ../processed_history.json 的 default 数据集
+DATASETS_FILE = 'datasets.json'
+DEFAULT_DATASET = 'default'
+DEFAULT_DATASET_PATH = '../processed_history.json'
+# 已加载数据集的内存预算，按加载后实测的对象大小计算；超出时淘汰最久未使用的数据集
+DATASET_MEMORY_BUDGET_MB = 512
+# 每个数据集缓存的词云结果数量
+DATASET_RESULT_CACHE_SIZE = 32
+# 主题趋势图中展示的主题数量
+TOPIC_TREND_LIMIT = 5
+# preload() 为每个数据集预先计算的词云 (时间范围均为 'all'，与页面默认请求的缓存键一致)
+PRELOAD_WORD_CLOUD_TYPES = ('both', 'user', 'ai')
 
-def load_data():
-    global data_cache
-    if data_cache is None:
+# 流式分析接口用于并行计算各部分统计的线程池
+analysis_executor = ThreadPoolExecutor(max_workers=4)
+
+# 情感分析词表 (每个词表最多16个词，命中情况以 uint16 位掩码保存)
+POSITIVE_WORDS = ['好', '棒', '优秀', '满意', '喜欢', '赞', '完美', '正确', '成功', '有用', '感谢', '谢谢', '不错', '很好']
+NEGATIVE_WORDS = ['不好', '差', '错误', '失败', '问题', '困难', '麻烦', '不行', '不对', '糟糕', '烦人', '讨厌', '无聊', '失望']
+# uint16 位掩码中 1 的个数，即命中的情感词数
+BIT_COUNTS = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.int8)
+
+def sentiment_masks(texts, words):
+    """返回每段文本命中 words 中哪些词的位掩码。"""
+    return np.array(
+        [sum(1 << i for i, word in enumerate(words) if word in text) for text in texts],
+        dtype=np.uint16
+    )
+
+class TextColumn:
+    """UTF-8 编码后拼接成单个 bytes 对象的文本列，按行号取出时才解码为 str。"""
+
+    def __init__(self, texts):
+        encoded = [text.encode('utf-8') for text in texts]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=self.offsets[1:])
+        self.buffer = b''.join(encoded)
+
+    @property
+    def nbytes(self):
+        return len(self.buffer) + self.offsets.nbytes
+
+    def take(self, rows):
+        """按 rows 的顺序逐个返回文本。"""
+        buffer = self.buffer
+        for start, end in zip(self.offsets[rows].tolist(), self.offsets[rows + 1].tolist()):
+            yield buffer[start:end].decode('utf-8')
+
+class DatasetColumns:
+    """
+    加载后只读的列式数据：时间戳、标签、主题编号、文本长度和情感词命中情况保存为 NumPy 数组，
+    文本保存为 TextColumn，标签和月份以编号数组加标签表的形式保存。
+    多进程部署时 worker 读取这些数据只会生成临时对象，不会像读取逐条对话的 dict 那样
+    修改共享内存页上的引用计数，从而避免写时复制把整个数据集复制到每个 worker。
+    """
+
+    def __init__(self, name, data, topics=None):
+        self.size = len(data)
+        user_texts = [item.get('user_prompt_cleaned') or '' for item in data]
+        ai_texts = [item.get('ai_response_cleaned') or '' for item in data]
+        self.user_text = TextColumn(user_texts)
+        self.ai_text = TextColumn(ai_texts)
+        self.user_lengths = np.array([len(text) for text in user_texts], dtype=np.int64)
+        self.ai_lengths = np.array([len(text) for text in ai_texts], dtype=np.int64)
+        self.sentiment = {
+            'user': (sentiment_masks(user_texts, POSITIVE_WORDS), sentiment_masks(user_texts, NEGATIVE_WORDS)),
+            'ai': (sentiment_masks(ai_texts, POSITIVE_WORDS), sentiment_masks(ai_texts, NEGATIVE_WORDS)),
+        }
+
+        dates = [parse_date(item.get('timestamp', '')) for item in data]
+        self.has_timestamp = np.array(['timestamp' in item for item in data], dtype=bool)
+        self.timestamps = np.array(dates, dtype='datetime64[s]')
+        self.month_labels, self.month_codes = np.unique(
+            np.array([date.strftime('%Y-%m') for date in dates], dtype=str), return_inverse=True
+        )
+
+        # 标签按首次出现的顺序编号，第 i 条对话的标签为 tag_codes[tag_offsets[i]:tag_offsets[i + 1]]
+        tag_ids, tag_codes, tag_offsets = {}, [], [0]
+        for item in data:
+            for tag in item.get('tags') or []:
+                tag_codes.append(tag_ids.setdefault(tag, len(tag_ids)))
+            tag_offsets.append(len(tag_codes))
+        self.tag_labels = np.array(list(tag_ids), dtype=str)
+        self.tag_codes = np.array(tag_codes, dtype=np.int64)
+        self.tag_offsets = np.array(tag_offsets, dtype=np.int64)
+
+        self.topics = topics
+        self.topic_ids = np.array(
+            [-1 if item.get('topic_id') is None else item['topic_id'] for item in data], dtype=np.int64
+        )
+        if topics is not None:
+            # 主题文件与数据可能来自不同的流水线运行，超出范围的编号视为未分配
+            out_of_range = (self.topic_ids < -1) | (self.topic_ids >= len(topics))
+            if out_of_range.any():
+                print(f"[警告] 数据集 '{name}' 中有 {int(out_of_range.sum())} 条对话的主题编号"
+                      f"超出主题文件范围 ({len(topics)} 个主题)，已视为未分配")
+                self.topic_ids[out_of_range] = -1
+
+        self.nbytes = sum(
+            value.nbytes for value in vars(self).values() if isinstance(value, (np.ndarray, TextColumn))
+        ) + sum(mask.nbytes for masks in self.sentiment.values() for mask in masks)
+
+    def all_rows(self):
+        return np.arange(self.size)
+
+    def lengths(self, analysis_type):
+        if analysis_type == 'user':
+            return self.user_lengths
+        if analysis_type == 'ai':
+            return self.ai_lengths
+        return self.user_lengths + self.ai_lengths
+
+    def sentiment_masks(self, analysis_type):
+        """返回 (正面词掩码, 负面词掩码)；'both' 拼接两段文本，等价于两者按位或。"""
+        if analysis_type in self.sentiment:
+            return self.sentiment[analysis_type]
+        (user_pos, user_neg), (ai_pos, ai_neg) = self.sentiment['user'], self.sentiment['ai']
+        return user_pos | ai_pos, user_neg | ai_neg
+
+    def tag_counts(self, rows):
+        """返回 rows 中各标签的 [(标签, 次数), ...]，按次数降序，次数相同时按首次出现的顺序。"""
+        starts = self.tag_offsets[rows]
+        counts = self.tag_offsets[rows + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return []
+        # 按行顺序收集所选对话的全部标签编号
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        codes, first_seen, tag_counts = np.unique(self.tag_codes[positions], return_index=True, return_counts=True)
+        order = np.lexsort((first_seen, -tag_counts))
+        return [(str(self.tag_labels[codes[i]]), int(tag_counts[i])) for i in order]
+
+class Dataset:
+    """单个数据集：列式数据和结果缓存均在首次使用时构建。"""
+
+    def __init__(self, name, path, on_load=None):
+        self.name = name
+        self.path = path
+        # 每次从磁盘 (重新) 加载后回调，由 DatasetRegistry 用于将数据集计入内存预算
+        self.on_load = on_load
+        self.columns = None
+        self.results = OrderedDict()
+        self.lock = threading.RLock()
+
+    @property
+    def loaded(self):
+        return self.columns is not None
+
+    @property
+    def memory_bytes(self):
+        """已加载的列式数据占用的内存 (加载时统计一次)。"""
+        with self.lock:
+            return self.columns.nbytes if self.columns is not None else 0
+
+    @property
+    def topics_path(self):
+        # 由 data_pipeline.py 的主题聚类步骤生成，命名规则与 get_topics_json_path 一致
+        return os.path.splitext(self.path)[0] + '_topics.json'
+
+    def load_topics(self):
+        """返回主题描述列表；数据集没有主题聚类结果时返回 None。"""
+        if not os.path.exists(self.topics_path):
+            return None
+        with open(self.topics_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['topics']
+
+    def load(self):
+        """返回 DatasetColumns；解析后的 JSON 对象在构建完列式数据后即被释放。"""
+        reloaded = False
+        with self.lock:
+            if self.columns is None:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.columns = DatasetColumns(self.name, data, self.load_topics())
+                del data
+                print(f"数据集 '{self.name}' 成功加载 {self.columns.size} 条数据，"
+                      f"约占用内存 {self.columns.nbytes / 1024 / 1024:.1f} MB")
+                reloaded = True
+            columns = self.columns
+        # 在释放锁之后回调，避免与 DatasetRegistry 的锁形成死锁；
+        # 请求处理过程中数据集被淘汰后又重新加载时，同样会重新计入 LRU 和内存预算
+        if reloaded and self.on_load:
+            self.on_load(self)
+        return columns
+
+    def unload(self):
+        with self.lock:
+            self.columns = None
+            self.results.clear()
+        print(f"数据集 '{self.name}' 已从内存中释放")
+
+    def cached(self, key, compute):
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        result = compute()
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > DATASET_RESULT_CACHE_SIZE:
+                self.results.popitem(last=False)
+        return result
+
+class DatasetRegistry:
+    """按名称管理多个数据集，并在超出内存预算时按LRU顺序卸载。"""
+
+    def __init__(self, datasets, budget_bytes):
+        self.datasets = {name: Dataset(name, path, on_load=self.touch) for name, path in datasets.items()}
+        self.budget_bytes = budget_bytes
+        self.lru = OrderedDict()  # 已加载的数据集名称，最近使用的在末尾
+        self.lock = threading.Lock()
+
+    def names(self):
+        return list(self.datasets)
+
+    def get(self, name=None):
+        """返回已加载的数据集；名称未知或加载失败时返回 None。"""
+        dataset = self.datasets.get(name or next(iter(self.datasets)))
+        if dataset is None:
+            return None
         try:
-            with open('../processed_history.json', 'r', encoding='utf-8') as f:
-                data_cache = json.load(f)
-                print(f"成功加载 {len(data_cache)} 条数据")
+            dataset.load()
         except Exception as e:
             print(f"Error loading data: {e}")
             return None
-    return data_cache
+        self.touch(dataset)
+        return dataset
+
+    def touch(self, dataset):
+        """将数据集标记为最近使用，并在超出内存预算时淘汰其他数据集。"""
+        with self.lock:
+            self.lru[dataset.name] = dataset
+            self.lru.move_to_end(dataset.name)
+            self._evict(keep=dataset.name)
+
+    def _evict(self, keep):
+        used = sum(d.memory_bytes for d in self.lru.values())
+        for name in list(self.lru):
+            if used <= self.budget_bytes:
+                break
+            if name == keep:
+                continue
+            evicted = self.lru.pop(name)
+            used -= evicted.memory_bytes
+            evicted.unload()
+
+def load_datasets_config():
+    datasets = {DEFAULT_DATASET: DEFAULT_DATASET_PATH}
+    budget_mb = DATASET_MEMORY_BUDGET_MB
+    if os.path.exists(DATASETS_FILE):
+        try:
+            with open(DATASETS_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            datasets = config.get('datasets') or datasets
+            budget_mb = config.get('memory_budget_mb', budget_mb)
+            print(f"成功从 '{DATASETS_FILE}' 加载 {len(datasets)} 个数据集配置")
+        except Exception as e:
+            print(f"加载数据集配置失败 {DATASETS_FILE}: {e}")
+    return DatasetRegistry(datasets, budget_mb * 1024 * 1024)
+
+dataset_registry = load_datasets_config()
 
 def parse_date(timestamp):
     # 尝试解析 "2025年8月14日 10:00:08 JST" 格式
@@ -87,55 +343,39 @@ def is_stop_word(word):
     stopwords = load_stopwords()
     return word in stopwords
 
-def get_word_frequency(text):
-    print(f"=== 开始高质量词云分析 ===")
-    print(f"原始文本长度: {len(text)} 字符")
-    
-    # 第一步：文本清洗
+# 保留的词性：名词(n)、动词(v)、形容词(a)、专有名词(nr)、地名(ns)、机构名(nt)
+KEEP_POS = {'n', 'nr', 'ns', 'nt', 'nz', 'v', 'vn', 'a', 'an'}
+
+# 词频统计模式: "exact" 精确计数; "sketch" 使用 Space-Saving 草图，内存固定;
+# "auto" 在文本总长度超过 WORD_FREQ_SKETCH_THRESHOLD 时自动切换为 sketch
+WORD_FREQ_MODE = 'auto'
+WORD_FREQ_SKETCH_THRESHOLD = 5_000_000
+WORD_FREQ_SKETCH_CAPACITY = 5000
+
+def clean_text_for_segmentation(text):
     # 去除URL、邮箱、特殊符号等噪音
     clean_text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
     clean_text = re.sub(r'\S+@\S+', '', clean_text)
     clean_text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z\s]', '', clean_text)
-    print(f"文本清洗后长度: {len(clean_text)} 字符")
-    
-    # 第二步：使用jieba进行专业分词
-    words = jieba.lcut(clean_text)
-    print(f"jieba分词完成，共分出 {len(words)} 个词")
-    
-    # 第三步：词性标注筛选（只保留名词、动词、形容词）
-    import jieba.posseg as pseg
-    pos_words = pseg.lcut(clean_text)
-    
-    # 保留的词性：名词(n)、动词(v)、形容词(a)、专有名词(nr)、地名(ns)、机构名(nt)
-    keep_pos = {'n', 'nr', 'ns', 'nt', 'nz', 'v', 'vn', 'a', 'an'}
-    
-    frequency = {}
-    valid_words = []
-    
-    for word, pos in pos_words:
-        # 多层过滤条件
-        if (len(word) >= 2 and  # 长度至少2个字符
-            any(pos.startswith(p) for p in keep_pos) and  # 词性筛选
+    return clean_text
+
+def is_valid_term(word, pos):
+    # 多层过滤条件
+    return (len(word) >= 2 and  # 长度至少2个字符
+            any(pos.startswith(p) for p in KEEP_POS) and  # 词性筛选
             re.search(r'[\u4e00-\u9fa5]', word) and  # 包含中文
             not is_stop_word(word) and  # 不是停用词
             word.strip() and  # 不是空白
-            len(set(word)) > 1):  # 避免重复字符如"的的"
-            
-            frequency[word] = frequency.get(word, 0) + 1
-            valid_words.append(word)
-    
-    print(f"词性筛选后有效词汇: {len(valid_words)} 个")
-    print(f"去重后词汇种类: {len(frequency)} 种")
-    
+            len(set(word)) > 1)  # 避免重复字符如"的的"
+
+def is_valid_bigram(bigram):
+    return (len(bigram) >= 4 and  # 词组长度至少4个字符
+            not is_stop_word(bigram) and
+            re.search(r'[\u4e00-\u9fa5]', bigram))
+
+def select_top_terms(frequency, bigrams, total_words):
+    """对词频和词组频次应用动态阈值，返回最多200个高质量词汇。"""
     # 第四步：基于词频的智能过滤
-    total_words = len(valid_words)
-    if total_words == 0:
-        return {}
-    
-    # 计算词频分布统计
-    freq_values = list(frequency.values())
-    freq_values.sort(reverse=True)
-    
     # 动态阈值：去除低频词（出现次数 < 总词数的0.1%）
     min_freq_threshold = max(2, int(total_words * 0.001))
     
@@ -151,17 +391,7 @@ def get_word_frequency(text):
     print(f"频率过滤: 最小阈值={min_freq_threshold}, 最大阈值={max_freq_threshold}")
     print(f"频率过滤后词汇: {len(filtered_by_freq)} 个")
     
-    # 第五步：提取N-grams（词组）
-    # 寻找高频的2-gram组合
-    bigrams = {}
-    for i in range(len(valid_words) - 1):
-        bigram = valid_words[i] + valid_words[i+1]
-        if (len(bigram) >= 4 and  # 词组长度至少4个字符
-            not is_stop_word(bigram) and
-            re.search(r'[\u4e00-\u9fa5]', bigram)):
-            bigrams[bigram] = bigrams.get(bigram, 0) + 1
-    
-    # 将高频词组加入结果
+    # 第五步：将高频词组加入结果
     bigram_threshold = max(2, int(total_words * 0.0005))
     for bigram, count in bigrams.items():
         if count >= bigram_threshold:
@@ -188,6 +418,94 @@ def get_word_frequency(text):
     
     return filtered_by_freq
 
+def get_word_frequency(text):
+    print(f"=== 开始高质量词云分析 ===")
+    print(f"原始文本长度: {len(text)} 字符")
+    
+    # 第一步：文本清洗
+    clean_text = clean_text_for_segmentation(text)
+    print(f"文本清洗后长度: {len(clean_text)} 字符")
+    
+    # 第二步：使用jieba进行专业分词
+    words = jieba.lcut(clean_text)
+    print(f"jieba分词完成，共分出 {len(words)} 个词")
+    
+    # 第三步：词性标注筛选（只保留名词、动词、形容词）
+    pos_words = pseg.lcut(clean_text)
+    
+    frequency = {}
+    valid_words = []
+    
+    for word, pos in pos_words:
+        if is_valid_term(word, pos):
+            frequency[word] = frequency.get(word, 0) + 1
+            valid_words.append(word)
+    
+    print(f"词性筛选后有效词汇: {len(valid_words)} 个")
+    print(f"去重后词汇种类: {len(frequency)} 种")
+    
+    total_words = len(valid_words)
+    if total_words == 0:
+        return {}
+    
+    # 寻找高频的2-gram组合
+    bigrams = {}
+    for i in range(len(valid_words) - 1):
+        bigram = valid_words[i] + valid_words[i+1]
+        if is_valid_bigram(bigram):
+            bigrams[bigram] = bigrams.get(bigram, 0) + 1
+    
+    return select_top_terms(frequency, bigrams, total_words)
+
+def build_term_sketches(texts, capacity=None, sketches=None):
+    """
+    逐段分词，将有效词和相邻词组写入固定容量的 Space-Saving 草图，
+    不保留完整的分词结果。传入已有的 (unigrams, bigrams) 草图时在其基础上继续累加。
+    """
+    capacity = capacity or WORD_FREQ_SKETCH_CAPACITY
+    unigrams, bigrams = sketches or (SpaceSaving(capacity), SpaceSaving(capacity))
+    prev_word = None
+    for text in texts:
+        for word, pos in pseg.cut(clean_text_for_segmentation(text)):
+            if not is_valid_term(word, pos):
+                continue
+            unigrams.add(word)
+            # 与精确模式一致，词组跨越相邻的文本段
+            if prev_word is not None:
+                bigram = prev_word + word
+                if is_valid_bigram(bigram):
+                    bigrams.add(bigram)
+            prev_word = word
+    return unigrams, bigrams
+
+def get_word_frequency_sketch(texts, capacity=None):
+    """
+    get_word_frequency 的有界内存版本，返回 (词频字典, 精度说明)。
+    texts 可以是任意可迭代对象，无需拼接成完整文本。
+    """
+    print(f"=== 开始高质量词云分析 (Space-Saving 草图模式) ===")
+    unigrams, bigrams = build_term_sketches(texts, capacity)
+    return select_terms_from_sketches(unigrams, bigrams)
+
+def select_terms_from_sketches(unigrams, bigrams):
+    """从 (可能已合并的) 草图中选出高频词汇，并附带精度说明。"""
+    total_words = unigrams.total
+    print(f"词性筛选后有效词汇: {total_words} 个，草图跟踪词汇: {len(unigrams)} 种")
+    accuracy = {"mode": "sketch", "unigrams": unigrams.accuracy(), "bigrams": bigrams.accuracy()}
+    if total_words == 0:
+        return {}, accuracy
+
+    frequency = {word: count for word, count, _ in unigrams.items()}
+    bigram_counts = {bigram: count for bigram, count, _ in bigrams.items()}
+    return select_top_terms(frequency, bigram_counts, total_words), accuracy
+
+def resolve_word_freq_mode(mode, texts):
+    mode = mode or WORD_FREQ_MODE
+    if mode == 'auto':
+        total_length = sum(len(text) for text in texts)
+        return 'sketch' if total_length > WORD_FREQ_SKETCH_THRESHOLD else 'exact'
+    return mode if mode in ('exact', 'sketch') else 'exact'
+
 @app.route('/')
 def index():
     return send_from_directory('.', 'index.html')
@@ -196,8 +514,8 @@ def index():
 def static_files(path):
     return send_from_directory('.', path)
 
-def calculate_overview_stats(data):
-    if not data:
+def calculate_overview_stats(columns, rows):
+    if len(rows) == 0:
         return {
             "totalConversations": 0,
             "avgLength": 0,
@@ -206,68 +524,45 @@ def calculate_overview_stats(data):
         }
 
     # 平均长度
-    total_length = sum(
-        len(item.get('user_prompt_cleaned', '')) + len(item.get('ai_response_cleaned', ''))
-        for item in data
-    )
-    avg_length = round(total_length / len(data)) if data else 0
+    total_length = int(columns.lengths('both')[rows].sum())
+    avg_length = round(total_length / len(rows))
 
     # 最高频标签
-    tag_counts = {}
-    for item in data:
-        for tag in item.get('tags', []):
-            tag_counts[tag] = tag_counts.get(tag, 0) + 1
-    top_tag = max(tag_counts, key=tag_counts.get) if tag_counts else "无"
-
-    # 时间跨度
-    dates = [parse_date(item['timestamp']) for item in data if 'timestamp' in item]
+    tag_counts = columns.tag_counts(rows)
+    top_tag = tag_counts[0][0] if tag_counts else "无"
+
+    # 时间跨度 (缺少时间戳的对话不计入)
+    dates = columns.timestamps[rows][columns.has_timestamp[rows]]
     time_span = "无数据"
-    if dates:
-        diff_days = (max(dates) - min(dates)).days
+    if len(dates):
+        diff_days = int((dates.max() - dates.min()) // np.timedelta64(1, 'D'))
         time_span = f"{diff_days} 天"
 
     return {
-        "totalConversations": len(data),
+        "totalConversations": len(rows),
         "avgLength": avg_length,
         "topTag": top_tag,
         "timeSpan": time_span
     }
 
-def calculate_chart_data(data, analysis_type):
+# 长度图表的分段边界 (左闭右开)
+LENGTH_BIN_EDGES = [100, 500, 1000, 2000, 5000]
+LENGTH_BIN_LABELS = ['0-100', '100-500', '500-1000', '1000-2000', '2000-5000', '5000+']
+
+def calculate_chart_data(columns, rows, analysis_type):
     # 兴趣图表
-    tag_counts = {}
-    for item in data:
-        for tag in item.get('tags', []):
-            tag_counts[tag] = tag_counts.get(tag, 0) + 1
-    interest_chart = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+    interest_chart = columns.tag_counts(rows)[:10]
 
     # 时间图表
-    time_data = {}
-    for item in data:
-        date = parse_date(item['timestamp'])
-        key = date.strftime('%Y-%m')
-        time_data[key] = time_data.get(key, 0) + 1
-    time_chart = sorted(time_data.items())
+    month_counts = np.bincount(columns.month_codes[rows], minlength=len(columns.month_labels))
+    time_chart = [
+        (str(label), int(count)) for label, count in zip(columns.month_labels, month_counts) if count > 0
+    ]
 
     # 长度图表
-    lengths = []
-    for item in data:
-        if analysis_type == 'user':
-            lengths.append(len(item.get('user_prompt_cleaned', '')))
-        elif analysis_type == 'ai':
-            lengths.append(len(item.get('ai_response_cleaned', '')))
-        else:
-            lengths.append(len(item.get('user_prompt_cleaned', '')) + len(item.get('ai_response_cleaned', '')))
-    
-    bins = [0, 100, 500, 1000, 2000, 5000, float('inf')]
-    bin_labels = ['0-100', '100-500', '500-1000', '1000-2000', '2000-5000', '5000+']
-    bin_counts = [0] * (len(bins) - 1)
-    for length in lengths:
-        for i in range(len(bins) - 1):
-            if bins[i] <= length < bins[i+1]:
-                bin_counts[i] += 1
-                break
-    length_chart = {"labels": bin_labels, "data": bin_counts}
+    lengths = columns.lengths(analysis_type)[rows]
+    bin_counts = np.bincount(np.digitize(lengths, LENGTH_BIN_EDGES), minlength=len(LENGTH_BIN_LABELS))
+    length_chart = {"labels": LENGTH_BIN_LABELS, "data": bin_counts.tolist()}
 
     return {
         "interestChart": interest_chart,
@@ -275,37 +570,17 @@ def calculate_chart_data(data, analysis_type):
         "lengthChart": length_chart
     }
 
-def calculate_detailed_stats(data, analysis_type):
+def calculate_detailed_stats(columns, rows, analysis_type):
     # 标签统计
-    tag_counts = {}
-    for item in data:
-        for tag in item.get('tags', []):
-            tag_counts[tag] = tag_counts.get(tag, 0) + 1
-    tag_stats = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:15]
-
-    # 情感分析
-    positive_words = ['好', '棒', '优秀', '满意', '喜欢', '赞', '完美', '正确', '成功', '有用', '感谢', '谢谢', '不错', '很好']
-    negative_words = ['不好', '差', '错误', '失败', '问题', '困难', '麻烦', '不行', '不对', '糟糕', '烦人', '讨厌', '无聊', '失望']
-    positive, negative, neutral = 0, 0, 0
-    
-    for item in data:
-        text = ''
-        if analysis_type == 'user':
-            text = item.get('user_prompt_cleaned', '')
-        elif analysis_type == 'ai':
-            text = item.get('ai_response_cleaned', '')
-        else:
-            text = item.get('user_prompt_cleaned', '') + ' ' + item.get('ai_response_cleaned', '')
-        
-        pos_count = sum(1 for word in positive_words if word in text)
-        neg_count = sum(1 for word in negative_words if word in text)
+    tag_stats = columns.tag_counts(rows)[:15]
 
-        if pos_count > neg_count:
-            positive += 1
-        elif neg_count > pos_count:
-            negative += 1
-        else:
-            neutral += 1
+    # 情感分析：比较每条对话命中的正面词和负面词数量
+    positive_masks, negative_masks = columns.sentiment_masks(analysis_type)
+    pos_count = BIT_COUNTS[positive_masks[rows]]
+    neg_count = BIT_COUNTS[negative_masks[rows]]
+    positive = int((pos_count > neg_count).sum())
+    negative = int((neg_count > pos_count).sum())
+    neutral = len(rows) - positive - negative
     
     total = positive + negative + neutral if positive + negative + neutral > 0 else 1
     sentiment_stats = {
@@ -320,71 +595,159 @@ def calculate_detailed_stats(data, analysis_type):
     }
 
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_data():
-    all_data = load_data()
-    if all_data is None:
-        return jsonify({"error": "Failed to load data"}), 500
+def get_time_range_limit(time_range, now):
+    """返回时间范围的起始时间；'all' 或未知范围返回 None。"""
+    if time_range == 'week':
+        return now - timedelta(days=7)
+    if time_range == 'month':
+        return now - timedelta(days=30)
+    return None
 
-    req_data = request.json
-    time_range = req_data.get('timeRange', 'all')
-    analysis_type = req_data.get('analysisType', 'both')
-
-    # 1. 根据时间过滤数据
+def filter_data_by_time(dataset, time_range):
+    """返回 (列式数据, 所选时间范围内的行号数组)。"""
+    # 行号与同一次 load() 取得的列式数据对应，即使数据集随后被其他请求淘汰也不受影响；
+    # 淘汰后重新加载会经由 on_load 回调重新计入 DatasetRegistry 的内存预算
+    columns = dataset.load()
     now = datetime.now()
-    filtered_data = []
     
     print(f"当前时间: {now}")
     print(f"时间范围: {time_range}")
     
-    if time_range == 'all':
-        filtered_data = all_data
-        print(f"选择全部数据: {len(filtered_data)} 条")
+    limit_date = get_time_range_limit(time_range, now)
+    if limit_date:
+        print(f"时间限制: {limit_date}")
+        rows = np.flatnonzero(columns.timestamps >= np.datetime64(limit_date, 'us'))
+        print(f"过滤后数据: {len(rows)} 条")
     else:
-        time_delta = None
-        if time_range == 'week':
-            time_delta = timedelta(days=7)
-        elif time_range == 'month':
-            time_delta = timedelta(days=30)
-        
-        if time_delta:
-            limit_date = now - time_delta
-            print(f"时间限制: {limit_date}")
-            
-            for item in all_data:
-                item_date = parse_date(item.get('timestamp', ''))
-                if item_date >= limit_date:
-                    filtered_data.append(item)
-            
-            print(f"过滤后数据: {len(filtered_data)} 条")
-        else:
-            filtered_data = all_data
+        rows = columns.all_rows()
+        print(f"选择全部数据: {len(rows)} 条")
+    return columns, rows
 
-    # 2. 提取文本用于词云
+def extract_text_parts(columns, rows, analysis_type):
+    """按对话顺序返回非空文本段；'both' 时每条对话依次为用户提问和AI回答。"""
+    if analysis_type == 'user':
+        return [text for text in columns.user_text.take(rows) if text]
+    if analysis_type == 'ai':
+        return [text for text in columns.ai_text.take(rows) if text]
+    if analysis_type != 'both':
+        return []
     text_parts = []
-    for item in filtered_data:
-        if analysis_type == 'user' and item.get('user_prompt_cleaned'):
-            text_parts.append(item['user_prompt_cleaned'])
-        elif analysis_type == 'ai' and item.get('ai_response_cleaned'):
-            text_parts.append(item['ai_response_cleaned'])
-        elif analysis_type == 'both':
-            if item.get('user_prompt_cleaned'):
-                text_parts.append(item['user_prompt_cleaned'])
-            if item.get('ai_response_cleaned'):
-                text_parts.append(item['ai_response_cleaned'])
-    
-    text = ' '.join(text_parts)
-    print(f"提取的文本总长度: {len(text)} 字符，来自 {len(filtered_data)} 条对话")
-    word_freq = get_word_frequency(text)
+    for user_text, ai_text in zip(columns.user_text.take(rows), columns.ai_text.take(rows)):
+        if user_text:
+            text_parts.append(user_text)
+        if ai_text:
+            text_parts.append(ai_text)
+    return text_parts
+
+def calculate_word_cloud(columns, rows, analysis_type, mode=None):
+    """返回 {"words": 前100个高频词, "accuracy": 草图模式的精度说明 (精确模式为 None)}。"""
+    text_parts = extract_text_parts(columns, rows, analysis_type)
+    mode = resolve_word_freq_mode(mode, text_parts)
+    print(f"词频统计模式: {mode}，来自 {len(rows)} 条对话的 {len(text_parts)} 段文本")
+
+    if mode == 'sketch':
+        word_freq, accuracy = get_word_frequency_sketch(text_parts)
+    else:
+        text = ' '.join(text_parts)
+        print(f"提取的文本总长度: {len(text)} 字符")
+        word_freq, accuracy = get_word_frequency(text), None
+    return {
+        "words": sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:100],
+        "accuracy": accuracy
+    }
+
+def calculate_dataset_word_cloud(dataset, time_range, columns, rows, analysis_type, mode=None):
+    # 相对时间范围随日期变化，因此缓存键包含当天日期；'all' 的结果不随日期变化，预加载后长期有效
+    now = datetime.now()
+    day = now.date() if get_time_range_limit(time_range, now) else None
+    key = (time_range, analysis_type, mode, day)
+    return dataset.cached(key, lambda: calculate_word_cloud(columns, rows, analysis_type, mode))
+
+def get_requested_dataset(name):
+    """返回 (数据集, 错误响应)，二者只有一个不为 None。"""
+    if name and name not in dataset_registry.datasets:
+        return None, ({"error": f"Unknown dataset: {name}"}, 404)
+    dataset = dataset_registry.get(name)
+    if dataset is None:
+        return None, ({"error": "Failed to load data"}, 500)
+    return dataset, None
+
+@app.route('/api/datasets')
+def list_datasets():
+    return jsonify([
+        {"name": name, "loaded": dataset.loaded, "memoryMB": round(dataset.memory_bytes / 1024 / 1024, 1)}
+        for name, dataset in dataset_registry.datasets.items()
+    ])
+
+@app.route('/api/topics')
+def topic_stats():
+    """基于流水线预计算的主题编号返回主题分布和按月趋势。"""
+    dataset, error = get_requested_dataset(request.args.get('dataset'))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    columns = dataset.load()
+    topics = columns.topics
+    if topics is None:
+        return jsonify({"error": "No topic clustering results for this dataset"}), 404
+
+    topic_ids = columns.topic_ids
+    mask = topic_ids >= 0
+    limit_date = get_time_range_limit(request.args.get('timeRange', 'all'), datetime.now())
+    if limit_date:
+        mask &= columns.timestamps >= np.datetime64(limit_date, 'us')
+
+    selected_topics = topic_ids[mask]
+    selected_months = columns.month_codes[mask]
+    counts = np.bincount(selected_topics, minlength=len(topics))
+    distribution = [
+        [topics[i]['label'], int(counts[i])]
+        for i in np.argsort(counts, kind='stable')[::-1] if counts[i] > 0
+    ]
+
+    # 月份 x 主题 的计数矩阵，只保留所选范围内出现过的月份
+    months = np.unique(selected_months)
+    grid = np.zeros((len(columns.month_labels), len(topics)), dtype=np.int64)
+    np.add.at(grid, (selected_months, selected_topics), 1)
+    top_topics = [i for i in np.argsort(counts, kind='stable')[::-1][:TOPIC_TREND_LIMIT] if counts[i] > 0]
+
+    return jsonify({
+        "distribution": distribution,
+        "trend": {
+            "labels": columns.month_labels[months].tolist(),
+            "series": [
+                {"label": topics[i]['label'], "data": grid[months, i].tolist()}
+                for i in top_topics
+            ]
+        }
+    })
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_data():
+    req_data = request.json
+    dataset, error = get_requested_dataset(req_data.get('dataset'))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    time_range = req_data.get('timeRange', 'all')
+    analysis_type = req_data.get('analysisType', 'both')
+    word_freq_mode = req_data.get('wordFreqMode')
+
+    # 1. 根据时间过滤数据
+    columns, rows = filter_data_by_time(dataset, time_range)
+
+    # 2. 提取文本用于词云
+    word_cloud = calculate_dataset_word_cloud(dataset, time_range, columns, rows, analysis_type, word_freq_mode)
 
     # 3. 并行计算所有统计数据
-    overview_stats = calculate_overview_stats(filtered_data)
-    chart_data = calculate_chart_data(filtered_data, analysis_type)
-    detailed_stats = calculate_detailed_stats(filtered_data, analysis_type)
+    overview_stats = calculate_overview_stats(columns, rows)
+    chart_data = calculate_chart_data(columns, rows, analysis_type)
+    detailed_stats = calculate_detailed_stats(columns, rows, analysis_type)
 
     # 4. 准备返回的数据
     response_data = {
-        "wordCloud": sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:100],
+        "wordCloud": word_cloud["words"],
+        "wordCloudAccuracy": word_cloud["accuracy"],
         "overviewStats": overview_stats,
         "chartData": chart_data,
         "detailedStats": detailed_stats
@@ -392,5 +755,68 @@ def analyze_data():
     
     return jsonify(response_data)
 
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/analyze/stream')
+def analyze_data_stream():
+    """
+    以 Server-Sent Events 逐步返回分析结果：概览统计立即返回，
+    图表、详细统计和词云在线程池中并行计算，哪个先完成就先推送哪个。
+    """
+    time_range = request.args.get('timeRange', 'all')
+    analysis_type = request.args.get('analysisType', 'both')
+    word_freq_mode = request.args.get('wordFreqMode')
+    dataset_name = request.args.get('dataset')
+
+    def generate():
+        dataset, error = get_requested_dataset(dataset_name)
+        if error:
+            # 不使用 'error' 作为事件名，避免与 EventSource 内置的连接错误事件冲突
+            yield format_sse('analysisError', error[0])
+            return
+
+        columns, rows = filter_data_by_time(dataset, time_range)
+
+        # 概览统计开销很小，先于分词任务计算，避免与 jieba 争抢 GIL
+        overview_stats = calculate_overview_stats(columns, rows)
+        futures = {
+            analysis_executor.submit(
+                calculate_dataset_word_cloud, dataset, time_range, columns, rows, analysis_type, word_freq_mode
+            ): 'wordCloud',
+            analysis_executor.submit(calculate_chart_data, columns, rows, analysis_type): 'chartData',
+            analysis_executor.submit(calculate_detailed_stats, columns, rows, analysis_type): 'detailedStats',
+        }
+        yield format_sse('overviewStats', overview_stats)
+
+        for future in as_completed(futures):
+            try:
+                yield format_sse(futures[future], future.result())
+            except Exception as e:
+                print(f"计算 {futures[future]} 时出错: {e}")
+                yield format_sse('sectionError', {"section": futures[future], "error": str(e)})
+        yield format_sse('done', {})
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+def preload():
+    """
+    预先加载停用词、jieba 词典、所有数据集的列式数据 (在内存预算允许的范围内)，
+    并计算页面默认的全部时间范围词云。
+    多进程部署时在 master 进程中调用，fork 出的 worker 直接共享这些内存页和缓存结果。
+    """
+    load_stopwords()
+    jieba.initialize()
+    for name in dataset_registry.names():
+        dataset = dataset_registry.get(name)
+        if dataset is None:
+            continue
+        columns, rows = filter_data_by_time(dataset, 'all')
+        for analysis_type in PRELOAD_WORD_CLOUD_TYPES:
+            calculate_dataset_word_cloud(dataset, 'all', columns, rows, analysis_type)
+    loaded = [name for name, dataset in dataset_registry.datasets.items() if dataset.loaded]
+    print(f"预加载完成，已加载数据集: {', '.join(loaded) or '无'}")
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
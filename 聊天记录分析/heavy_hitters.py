@@ -0,0 +1,125 @@
+"""
+基于 Space-Saving 算法的高频词统计，内存占用固定为 capacity 个计数器。
+
+每个计数器记录 (估计次数, 误差上界)，真实次数满足
+    估计次数 - 误差 <= 真实次数 <= 估计次数
+且任何真实次数超过 总词数 / capacity 的词一定会被保留。
+多个草图可以通过 merge 合并 (例如按分片或按月份分别统计后再汇总)。
+"""
+
+
+class SpaceSaving:
+    def __init__(self, capacity=2000):
+        if capacity < 1:
+            raise ValueError("capacity 必须为正整数")
+        self.capacity = capacity
+        self.total = 0
+        self.counters = {}  # item -> [count, error]
+        # 按次数分桶 (stream-summary)，使单位增量和淘汰都是 O(1)
+        self.buckets = {}   # count -> set(items)
+        self.min_count = 0
+        # 合并得到的草图即使未满，未跟踪的词也可能带有来自输入草图的误差
+        self.base_error = 0
+
+    def __len__(self):
+        return len(self.counters)
+
+    def _move(self, item, old_count, new_count):
+        if old_count:
+            bucket = self.buckets[old_count]
+            bucket.discard(item)
+            if not bucket:
+                del self.buckets[old_count]
+        self.buckets.setdefault(new_count, set()).add(item)
+
+    def _refresh_min(self):
+        self.min_count = min(self.buckets) if self.buckets else 0
+
+    def add(self, item):
+        """将 item 计数加一。"""
+        self.total += 1
+        counter = self.counters.get(item)
+        if counter is not None:
+            old_count = counter[0]
+            counter[0] += 1
+            self._move(item, old_count, counter[0])
+            if old_count == self.min_count and old_count not in self.buckets:
+                self.min_count += 1
+            return
+
+        if len(self.counters) < self.capacity:
+            count = self.base_error + 1
+            self.counters[item] = [count, self.base_error]
+            self._move(item, 0, count)
+            self.min_count = min(self.min_count, count) if self.min_count else count
+            return
+
+        # 已满：替换次数最少的计数器，新词继承其次数作为误差
+        min_count = self.min_count
+        evicted = self.buckets[min_count].pop()
+        if not self.buckets[min_count]:
+            del self.buckets[min_count]
+        del self.counters[evicted]
+        self.counters[item] = [min_count + 1, min_count]
+        self.buckets.setdefault(min_count + 1, set()).add(item)
+        if min_count not in self.buckets:
+            self.min_count = min_count + 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    @property
+    def max_error(self):
+        """任意词的计数误差上界：未满时为0，已满时为最小计数 (不超过 total / capacity)。"""
+        sketch_error = self.min_count if len(self.counters) >= self.capacity else 0
+        return max(sketch_error, self.base_error)
+
+    def estimate(self, item):
+        """返回 (估计次数, 误差上界)；未被跟踪的词返回 (max_error, max_error)。"""
+        counter = self.counters.get(item)
+        if counter is None:
+            return self.max_error, self.max_error
+        return counter[0], counter[1]
+
+    def items(self):
+        """按估计次数降序返回 [(item, count, error), ...]。"""
+        return sorted(
+            ((item, count, error) for item, (count, error) in self.counters.items()),
+            key=lambda x: x[1], reverse=True
+        )
+
+    def top(self, k):
+        return self.items()[:k]
+
+    def merge(self, other):
+        """
+        返回合并后的新草图 (容量取两者较大值)。
+        某一方未跟踪的词按该方的 max_error 补齐估计次数和误差，保证合并后仍是上界估计。
+        """
+        capacity = max(self.capacity, other.capacity)
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            count_a, error_a = self.counters.get(item, (self.max_error, self.max_error))
+            count_b, error_b = other.counters.get(item, (other.max_error, other.max_error))
+            merged[item] = [count_a + count_b, error_a + error_b]
+
+        result = SpaceSaving(capacity)
+        result.total = self.total + other.total
+        result.base_error = self.max_error + other.max_error
+        kept = sorted(merged.items(), key=lambda x: x[1][0], reverse=True)[:capacity]
+        result.counters = dict(kept)
+        for item, (count, _) in kept:
+            result.buckets.setdefault(count, set()).add(item)
+        result._refresh_min()
+        return result
+
+    def accuracy(self):
+        """用于随结果一起返回的精度说明。"""
+        return {
+            "capacity": self.capacity,
+            "tracked": len(self.counters),
+            "streamLength": self.total,
+            "maxError": self.max_error,
+            "maxErrorRatio": round(self.max_error / self.total, 6) if self.total else 0,
+        }
@@ -0,0 +1,115 @@
+"""
+/api/analyze 压力测试：并发发送请求并报告吞吐量 (requests/s) 和延迟分布。
+
+正式测量前先并发发送 --warmup 个预热请求 (默认与并发数相同，使多进程部署的每个 worker
+都至少处理过一次请求)，预热请求的延迟单独报告，不计入吞吐量和延迟分布。
+
+用法:
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 8 --requests 200
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须为正整数: {value}")
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"不能为负数: {value}")
+    return number
+
+
+# requests.Session 不是线程安全的，每个线程使用自己的会话 (并复用其中的长连接)
+thread_state = threading.local()
+
+
+def get_session():
+    session = getattr(thread_state, 'session', None)
+    if session is None:
+        session = thread_state.session = requests.Session()
+    return session
+
+
+def send_request(url, payload):
+    start = time.perf_counter()
+    try:
+        response = get_session().post(url, json=payload, timeout=300)
+        ok = response.status_code == 200
+    except requests.RequestException:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_requests(executor, url, payload, count):
+    """并发发送 count 个请求，返回 (排序后的延迟列表, 失败数, 总耗时)。"""
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    futures = [executor.submit(send_request, url, payload) for _ in range(count)]
+    for future in as_completed(futures):
+        ok, elapsed = future.result()
+        latencies.append(elapsed)
+        if not ok:
+            errors += 1
+    latencies.sort()
+    return latencies, errors, time.perf_counter() - start
+
+
+def report_latencies(latencies):
+    print(f"延迟 (s): 平均 {sum(latencies) / len(latencies):.3f}, "
+          f"p50 {percentile(latencies, 50):.3f}, p95 {percentile(latencies, 95):.3f}, "
+          f"p99 {percentile(latencies, 99):.3f}, 最大 {latencies[-1]:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对 /api/analyze 进行压力测试")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="服务地址 (默认 http://127.0.0.1:5000)")
+    parser.add_argument('--concurrency', type=positive_int, default=8, help="并发客户端数 (默认 8)")
+    parser.add_argument('--requests', type=positive_int, default=100, help="请求总数 (默认 100)")
+    parser.add_argument('--warmup', type=non_negative_int, default=None,
+                        help="预热请求数，不计入结果 (默认与并发数相同，0 表示不预热)")
+    parser.add_argument('--time-range', default='all', choices=['all', 'week', 'month'])
+    parser.add_argument('--analysis-type', default='both', choices=['both', 'user', 'ai'])
+    parser.add_argument('--dataset', default=None, help="数据集名称 (默认使用第一个数据集)")
+    args = parser.parse_args()
+    if args.warmup is None:
+        args.warmup = args.concurrency
+
+    url = f"{args.url.rstrip('/')}/api/analyze"
+    payload = {"timeRange": args.time_range, "analysisType": args.analysis_type}
+    if args.dataset:
+        payload["dataset"] = args.dataset
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        if args.warmup:
+            print(f"预热: {url}，{args.warmup} 个请求")
+            latencies, errors, total = run_requests(executor, url, payload, args.warmup)
+            print(f"预热完成，失败: {errors}，耗时 {total:.2f}s (冷启动请求，不计入以下结果)")
+            report_latencies(latencies)
+
+        latencies, errors, total = run_requests(executor, url, payload, args.requests)
+
+    print(f"\n请求总数: {args.requests}，并发数: {args.concurrency}，失败: {errors}")
+    print(f"总耗时: {total:.2f}s")
+    print(f"吞吐量: {args.requests / total:.2f} requests/s")
+    report_latencies(latencies)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,50 +4,138 @@ class DataAnalyzer {
         this.init();
     }
 
-    init() {
+    async init() {
         this.bindEvents();
+        await this.loadDatasets();
         this.performAnalysis(); // 初始加载一次默认数据
     }
 
+    async loadDatasets() {
+        const select = document.getElementById('dataset');
+        try {
+            const response = await fetch('/api/datasets');
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            const datasets = await response.json();
+            // 数据集名称来自 datasets.json，可能包含引号或尖括号，不能拼接进 innerHTML
+            select.replaceChildren(...datasets.map(({ name }) => new Option(name, name)));
+        } catch (error) {
+            console.error('加载数据集列表失败:', error);
+        }
+    }
+
     bindEvents() {
         document.getElementById('analyzeBtn').addEventListener('click', () => this.performAnalysis());
         document.getElementById('timeRange').addEventListener('change', () => this.performAnalysis());
         document.getElementById('analysisType').addEventListener('change', () => this.performAnalysis());
+        document.getElementById('dataset').addEventListener('change', () => this.performAnalysis());
     }
 
-    async performAnalysis() {
+    performAnalysis() {
+        // 新的分析请求会取代尚未完成的旧请求
+        if (this.eventSource) this.eventSource.close();
         this.showLoading(true);
 
-        try {
-            const analysisType = document.getElementById('analysisType').value;
-            const timeRange = document.getElementById('timeRange').value;
+        const analysisType = document.getElementById('analysisType').value;
+        const timeRange = document.getElementById('timeRange').value;
+        const dataset = document.getElementById('dataset').value;
+        const params = new URLSearchParams({ timeRange, analysisType });
+        if (dataset) params.set('dataset', dataset);
 
-            const response = await fetch('/api/analyze', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ timeRange, analysisType }),
-            });
+        this.loadTopics(params);
 
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const source = new EventSource(`/api/analyze/stream?${params}`);
+        this.eventSource = source;
+        const finish = () => {
+            source.close();
+            if (this.eventSource === source) this.eventSource = null;
+            this.showLoading(false);
+        };
 
-            const results = await response.json();
+        // 各部分结果到达后立即渲染，概览统计到达时即可关闭全屏加载层
+        source.addEventListener('overviewStats', (event) => {
+            this.updateOverviewStats(JSON.parse(event.data));
+            this.showLoading(false);
+            this.showWordCloudPending();
+        });
+        source.addEventListener('chartData', (event) => {
+            this.generateCharts(JSON.parse(event.data));
+        });
+        source.addEventListener('detailedStats', (event) => {
+            this.generateDetailedStats(JSON.parse(event.data));
+        });
+        source.addEventListener('wordCloud', (event) => {
+            const { words, accuracy } = JSON.parse(event.data);
+            this.generateWordCloud(words, accuracy);
+            this.generateTopWords(words);
+        });
+        source.addEventListener('done', finish);
+        // 单个部分计算失败：只在该部分显示错误，其余部分继续接收
+        source.addEventListener('sectionError', (event) => {
+            const { section, error } = JSON.parse(event.data);
+            console.error(`计算 ${section} 时出错:`, error);
+            this.showSectionError(section);
+        });
+        // 服务端无法开始分析 (如数据集不存在或加载失败)，不会再有后续事件
+        source.addEventListener('analysisError', (event) => {
+            console.error('分析过程出错:', JSON.parse(event.data));
+            finish();
+            alert('分析请求失败，请确保后端服务正在运行并检查其输出。');
+        });
+        // EventSource 内置的连接错误事件
+        source.addEventListener('error', () => {
+            console.error('分析连接中断');
+            finish();
+            alert('分析请求失败，请确保后端服务正在运行并检查其输出。');
+        });
+    }
 
-            // 更新所有UI组件
-            this.updateOverviewStats(results.overviewStats);
-            this.generateWordCloud(results.wordCloud);
-            this.generateCharts(results.chartData);
-            this.generateDetailedStats(results.detailedStats, results.wordCloud);
+    showLoading(show) {
+        document.getElementById('loading').classList.toggle('show', show);
+    }
 
+    async loadTopics(params) {
+        // 主题数据由流水线预先计算，数据集没有聚类结果时隐藏相关图表
+        const containers = document.querySelectorAll('.topic-chart');
+        try {
+            const response = await fetch(`/api/topics?${params}`);
+            if (!response.ok) {
+                containers.forEach(el => el.hidden = true);
+                return;
+            }
+            const topics = await response.json();
+            containers.forEach(el => el.hidden = false);
+            this.generateTopicCharts(topics);
         } catch (error) {
-            console.error('分析过程出错:', error);
-            alert('分析请求失败，请确保后端服务正在运行并检查其输出。');
-        } finally {
-            this.showLoading(false);
+            console.error('加载主题数据失败:', error);
+            containers.forEach(el => el.hidden = true);
         }
     }
 
-    showLoading(show) {
-        document.getElementById('loading').classList.toggle('show', show);
+    showSectionError(section) {
+        const message = '<p class="no-data section-error">该部分分析失败，请检查后端输出</p>';
+        if (section === 'chartData') {
+            ['interestChart', 'timeChart', 'lengthChart'].forEach(chartId => {
+                if (this.charts[chartId]) {
+                    this.charts[chartId].destroy();
+                    delete this.charts[chartId];
+                }
+                const canvas = document.getElementById(chartId);
+                canvas.hidden = true;
+                canvas.parentElement.querySelector('.section-error')?.remove();
+                canvas.insertAdjacentHTML('afterend', message);
+            });
+            return;
+        }
+        const containerIds = {
+            wordCloud: ['wordcloud', 'topWords'],
+            detailedStats: ['tagStats', 'sentimentStats'],
+        }[section] || [];
+        containerIds.forEach(id => document.getElementById(id).innerHTML = message);
+    }
+
+    showWordCloudPending() {
+        document.getElementById('wordcloud').innerHTML = '<p class="no-data">正在生成词云...</p>';
+        document.getElementById('topWords').innerHTML = '<p class="no-data">正在分词...</p>';
     }
 
     updateOverviewStats(stats) {
@@ -57,7 +145,7 @@ class DataAnalyzer {
         document.getElementById('timeSpan').textContent = stats.timeSpan || 'N/A';
     }
 
-    generateWordCloud(wordList) {
+    generateWordCloud(wordList, accuracy) {
         const container = document.getElementById('wordcloud');
         if (!wordList || wordList.length === 0) {
             container.innerHTML = '<p class="no-data">暂无数据</p>';
@@ -171,6 +259,10 @@ class DataAnalyzer {
             最高频词: "${wordList[0][0]}" (${wordList[0][1]}次) | 
             词频范围: ${minFreq}-${maxFreq}次
         `;
+        // 草图模式下的计数为上界估计，附上误差范围
+        if (accuracy) {
+            statsDiv.innerHTML += ` | 近似统计: 词频误差 ≤ ${accuracy.unigrams.maxError}次，词组误差 ≤ ${accuracy.bigrams.maxError}次`;
+        }
         container.appendChild(statsDiv);
     }
 
@@ -181,7 +273,11 @@ class DataAnalyzer {
     }
 
     createOrUpdateChart(chartId, type, data, options) {
-        const ctx = document.getElementById(chartId).getContext('2d');
+        const canvas = document.getElementById(chartId);
+        // 清除上一次分析留下的错误提示
+        canvas.hidden = false;
+        canvas.parentElement.querySelector('.section-error')?.remove();
+        const ctx = canvas.getContext('2d');
         if (this.charts[chartId]) {
             this.charts[chartId].destroy();
         }
@@ -212,6 +308,29 @@ class DataAnalyzer {
         }, { responsive: true, scales: { y: { beginAtZero: true } } });
     }
 
+    generateTopicCharts(topics) {
+        const colors = ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe', '#43e97b', '#38f9d7', '#ffecd2', '#fcb69f'];
+        const distribution = topics.distribution.slice(0, 10);
+        this.createOrUpdateChart('topicChart', 'doughnut', {
+            labels: distribution.map(item => item[0]),
+            datasets: [{
+                data: distribution.map(item => item[1]),
+                backgroundColor: colors
+            }]
+        }, { responsive: true, plugins: { legend: { position: 'bottom' } } });
+
+        this.createOrUpdateChart('topicTrendChart', 'line', {
+            labels: topics.trend.labels,
+            datasets: topics.trend.series.map((series, index) => ({
+                label: series.label,
+                data: series.data,
+                borderColor: colors[index % colors.length],
+                fill: false,
+                tension: 0.4
+            }))
+        }, { responsive: true, scales: { y: { beginAtZero: true } } });
+    }
+
     generateLengthChart(lengthData) {
         this.createOrUpdateChart('lengthChart', 'bar', {
             labels: lengthData.labels,
@@ -225,8 +344,7 @@ class DataAnalyzer {
         }, { responsive: true, scales: { y: { beginAtZero: true } } });
     }
 
-    generateDetailedStats(detailedStats, wordCloud) {
-        this.generateTopWords(wordCloud);
+    generateDetailedStats(detailedStats) {
         this.generateTagStats(detailedStats.tagStats);
         this.generateSentimentStats(detailedStats.sentimentStats);
     }
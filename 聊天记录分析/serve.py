@@ -0,0 +1,70 @@
+"""
+多进程生产环境入口 (基于 gunicorn，仅支持 Linux/macOS)。
+
+master 进程先加载数据集、默认词云、停用词和 jieba 词典，再 fork 出 worker，
+各 worker 通过写时复制共享这些只读数据，避免 N 个进程各自冷启动和占用 N 份内存。
+
+用法:
+    pip install gunicorn
+    python serve.py --workers 4 --bind 0.0.0.0:5000
+"""
+import argparse
+import gc
+import multiprocessing
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+import app as dashboard
+
+
+def post_fork(server, worker):
+    # master 在 fork 前冻结了所有对象，worker 内新建的对象照常参与垃圾回收
+    gc.enable()
+
+
+class DashboardApplication(BaseApplication if BaseApplication else object):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return dashboard.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以多进程模式启动聊天记录分析仪表盘")
+    parser.add_argument('--bind', default='127.0.0.1:5000', help="监听地址 (默认 127.0.0.1:5000)")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help="worker 进程数 (默认 CPU 核数)")
+    parser.add_argument('--threads', type=int, default=4, help="每个 worker 的线程数，SSE 长连接会占用线程 (默认 4)")
+    parser.add_argument('--timeout', type=int, default=300, help="单个请求的超时秒数 (默认 300)")
+    args = parser.parse_args()
+
+    if BaseApplication is None:
+        print("[错误] 未安装 gunicorn，请先运行 pip install gunicorn。开发环境可直接运行 python app.py。")
+        return
+
+    dashboard.preload()
+    # 将预加载的对象移入永久代：垃圾回收不再扫描它们，避免 worker 中的 GC 触碰共享页导致复制
+    gc.disable()
+    gc.freeze()
+
+    DashboardApplication({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'preload_app': True,
+        'post_fork': post_fork,
+    }).run()
+
+
+if __name__ == '__main__':
+    main()